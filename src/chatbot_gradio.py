@@ -1,7 +1,14 @@
-import json
+import asyncio
+import os
 
 import gradio as gr
 from agents import Agent, Runner
+from openai.types.responses import ResponseTextDeltaEvent
+
+# 全セッションで共有する LLM API への同時リクエスト数の上限
+# (環境変数 LLM_CONCURRENCY で変更できる)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
 
 with gr.Blocks() as demo:
     # UI を定義
@@ -12,47 +19,61 @@ with gr.Blocks() as demo:
             submit = gr.Button("送信")
             clear = gr.ClearButton([msg, chatbot], value="リセット")
 
+    # エージェントへの入力となる会話履歴
+    # Gradio の表示用の会話履歴とは別に、セッションごとに保持する
+    input_items = gr.State([])
+
     # エージェントを定義
     agent = Agent(
         name="素っ気ないアシスタント",
         instructions="あなたは素っ気ないアシスタントです。"
         "ユーザーの言葉に対して最小限のテキストで応答して。"
-        "ユーザーはJSON形式でメッセージを送りますが、"
         "応答は日本語の文字列にして。",
         model="gpt-4o-mini",
     )
 
-    # Runner.run() を非同期で呼ぶので async def を指定
-    async def respond(message, chat_history):
+    # Runner.run_streamed() の結果を非同期で受け取るので async def を指定
+    async def respond(message, chat_history, input_items):
         """メッセージ送信時の処理"""
         # 会話履歴にユーザーの発言を追加
         chat_history.append({"role": "user", "content": message})
+        input_items.append({"role": "user", "content": message})
 
-        # エージェントに会話履歴を送信
-        response = await Runner.run(
-            # ensure_ascii=False することで JSON エンコードを抑制
-            # LLM がメッセージを解釈しやすくなるようです
-            agent,
-            json.dumps(chat_history, ensure_ascii=False),
-        )
+        # エージェントに会話履歴を送信し、応答をストリーミングで受け取る
+        # 前回までの実行結果を to_input_list() で引き継ぐので、
+        # 会話履歴を毎回 JSON 文字列に変換して送る必要はない
+        # 同時リクエスト数の上限に達している場合は空くまで待つ
+        async with llm_semaphore:
+            result = Runner.run_streamed(agent, input_items)
 
-        # エージェントの出力を取得
-        bot_message = response.final_output
+            # 空のエージェントの出力を会話履歴に追加し、受け取った差分を追記する
+            chat_history.append({"role": "assistant", "content": ""})
+            async for event in result.stream_events():
+                if event.type == "raw_response_event" and isinstance(
+                    event.data, ResponseTextDeltaEvent
+                ):
+                    chat_history[-1]["content"] += event.data.delta
 
-        # エージェントの出力を会話履歴に追加
-        chat_history.append({"role": "assistant", "content": bot_message})
+                    # Gradio UI に途中までの会話履歴を返す
+                    yield "", chat_history, input_items
 
-        # Gradui UI に会話履歴を返す
-        return "", chat_history
+        # Gradio UI に会話履歴と次回のエージェントへの入力を返す
+        yield "", chat_history, result.to_input_list()
 
     # Gradio UI にコールバックを設定
     gr.on(
         triggers=[msg.submit, submit.click],
         fn=respond,
-        inputs=[msg, chatbot],
-        outputs=[msg, chatbot],
+        inputs=[msg, chatbot, input_items],
+        outputs=[msg, chatbot, input_items],
     )
 
+    # リセット時はエージェントへの入力も空にする
+    clear.click(lambda: [], outputs=[input_items])
+
+# respond は LLM の API 待ちがほとんどなので、複数ユーザーを同時に処理する
+demo.queue(default_concurrency_limit=16, max_size=64, api_open=False)
+
 if __name__ == "__main__":
     # gradio を起動
     demo.launch(share=True, debug=True)
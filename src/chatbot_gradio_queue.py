@@ -1,36 +1,107 @@
 import asyncio
-from typing import Any, AsyncGenerator, Callable, Coroutine, Dict, List, Union
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Dict, List
 
 import gradio as gr
-from agents import Agent, Runner  # OpenAI Agents SDK のライブラリ
+from agents import (  # OpenAI Agents SDK のライブラリ
+    Agent,
+    ModelSettings,
+    Runner,
+)
+from pydantic import BaseModel
+
+# チャットボットの型エイリアス
+ChatHistory = List[Dict[str, str | None]]
+
+
+# LLM API への同時リクエスト数の上限
+# 全セッション・全 CounterAgent で共有し、環境変数 LLM_CONCURRENCY で変更できる
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
 
 
-class EndOfMessage:
+async def run_limited(agent: Agent, prompt: str) -> Any:
     """
-    メッセージストリームの終了を示すためのマーカークラス。
-    キューに入れられ、受信側でストリームの終わりを判断するために使用されます。
+    LLM API への同時リクエスト数を制限しながらエージェントを実行します。
+
+    Args:
+        agent (Agent): 実行するエージェント。
+        prompt (str): エージェントへの入力。
+
+    Returns:
+        Any: エージェントの実行結果。
     """
+    async with llm_semaphore:
+        return await Runner.run(agent, prompt)
 
-    pass
 
+# 同じ問い合わせに対するエージェントの出力のキャッシュ (古いものから破棄)
+FINAL_OUTPUT_CACHE_SIZE = 1024
+_final_output_cache: OrderedDict[str, Any] = OrderedDict()
 
-# チャットボットの型エイリアス
-ChatHistory = List[Dict[str, str | None]]
-# コールバック関数の型エイリアス
-OutputFunc = Callable[[Union[str, EndOfMessage]], Coroutine[Any, Any, None]]
+
+async def cached_final_output(agent: Agent, prompt: str) -> Any:
+    """
+    エージェントの出力をキャッシュしながら取得します。
+
+    モデル・指示・入力が同じ問い合わせは同じ出力になるとみなし、
+    2回目以降はAPIを呼び出さずにキャッシュした出力を返します。
+    出力が確率的に変わる場合(temperatureが0でない場合)や、指示が動的な場合は
+    キャッシュせずに毎回問い合わせます。
+
+    Args:
+        agent (Agent): 問い合わせるエージェント。
+        prompt (str): エージェントへの入力。
+
+    Returns:
+        Any: エージェントの最終出力。
+    """
+    if agent.model_settings.temperature != 0 or not isinstance(
+        agent.instructions, str
+    ):
+        response = await run_limited(agent, prompt)
+        return response.final_output
+
+    key = hashlib.sha256(
+        "\0".join([str(agent.model), agent.instructions, prompt]).encode()
+    ).hexdigest()
+    if key in _final_output_cache:
+        _final_output_cache.move_to_end(key)
+        return _final_output_cache[key]
+
+    response = await run_limited(agent, prompt)
+    _final_output_cache[key] = response.final_output
+    if len(_final_output_cache) > FINAL_OUTPUT_CACHE_SIZE:
+        _final_output_cache.popitem(last=False)
+    return response.final_output
+
+
+class CountAssociation(BaseModel):
+    """
+    一括問い合わせで得られる、1つの数値に対する連想結果。
+    """
+
+    index: int
+    text: str
 
 
 class CounterAgent:
     """
     指定された最大値までカウントアップし、各カウントでAIエージェントを呼び出して
-    関連するテキストを生成し、指定された出力関数を介して結果を送信するエージェント。
+    関連するテキストを生成し、非同期ジェネレータとして結果を生成するエージェント。
 
     Attributes:
         DEFAULT_AGENT_NAME (str): AIエージェントのデフォルト名。
         DEFAULT_INSTRUCTIONS (str): AIエージェントへのデフォルト指示。
+        DEFAULT_BATCH_INSTRUCTIONS (str): 一括問い合わせ用のAIエージェントへの
+                                          デフォルト指示。
         DEFAULT_MODEL (str): 使用するAIモデルのデフォルト。
         max_value (int): カウントアップする最大値（この値は含まれない）。
-        output_func (OutputFunc): 生成されたメッセージを処理するためのコールバック関数。
+        batch (bool): 全ての数値を1回の問い合わせにまとめるかどうか。
         agent (Agent): 内部で使用されるOpenAI Agentインスタンス。
     """
 
@@ -41,26 +112,31 @@ class CounterAgent:
         "ユーザーはJSON形式でメッセージを送りますが、"
         "応答は日本語の文字列にして。"
     )
+    DEFAULT_BATCH_INSTRUCTIONS = (
+        "あなたは素っ気ないアシスタントです。"
+        "ユーザーはJSON形式で数値のリスト(numbers)と質問を送ります。"
+        "numbers の各数値について、index にその数値、text に質問への"
+        "最小限の日本語の応答を入れた連想結果のリストを返して。"
+    )
     DEFAULT_MODEL = "gpt-4o-mini"
 
     def __init__(
         self,
         max_value: int = 10,
-        output_func: OutputFunc | None = None,
-        agent_name: str = DEFAULT_AGENT_NAME,
-        instructions: str = DEFAULT_INSTRUCTIONS,
-        model: str = DEFAULT_MODEL,
+        agent: Agent | None = None,
+        batch: bool = False,
     ) -> None:
         """
         CounterAgentを初期化します。
 
         Args:
             max_value (int): カウントアップする最大値。1以上の整数である必要があります。
-            output_func (OutputFunc | None): メッセージ出力用のコールバック関数。
-                                              指定されない場合は標準出力に表示します。
-            agent_name (str): AIエージェントの名前。
-            instructions (str): AIエージェントへの指示。
-            model (str): 使用するAIモデル。
+            agent (Agent | None): 使用するAIエージェント。
+                                  指定されない場合はモジュール共通のエージェントを使います。
+            batch (bool): Trueの場合、全ての数値を1回の問い合わせにまとめ、
+                          構造化出力で数値ごとの連想結果を受け取ります。
+                          agentを指定する場合は `create_agent(batch=True)`
+                          で作成したエージェントを渡してください。
 
         Raises:
             ValueError: max_valueが1未満の場合。
@@ -69,155 +145,158 @@ class CounterAgent:
             raise ValueError("max_value は 1 以上の整数にしてください。")
 
         self.max_value = max_value
-        # output_funcがNoneの場合はデフォルトの出力メソッドを使用
-        self.output_func: OutputFunc = (
-            output_func if output_func is not None else self.default_output
-        )
+        self.batch = batch
 
-        # AIエージェントを初期化
-        self.agent = Agent(
-            name=agent_name,
-            instructions=instructions,
-            model=model,
-        )
+        # AIエージェントは呼び出しごとに作らず、モジュール共通のものを使い回す
+        if agent is None:
+            agent = batch_counter_agent if batch else counter_agent
+        self.agent = agent
 
-    async def default_output(self, message: Union[str, EndOfMessage]) -> None:
+    @classmethod
+    def create_agent(
+        cls,
+        batch: bool = False,
+        agent_name: str = DEFAULT_AGENT_NAME,
+        instructions: str | None = None,
+        model: str = DEFAULT_MODEL,
+    ) -> Agent:
         """
-        デフォルトの出力関数。メッセージを標準出力に表示します。
-        EndOfMessageオブジェクトは無視します。
+        CounterAgentで使用するAIエージェントを作成します。
 
         Args:
-            message (Union[str, EndOfMessage]): 出力するメッセージまたは終了マーカー。
-        """
-        if not isinstance(message, EndOfMessage):
-            print(f"{message}")
+            batch (bool): Trueの場合、数値ごとの連想結果のリストを出力させます。
+            agent_name (str): AIエージェントの名前。
+            instructions (str | None): AIエージェントへの指示。
+                指定されない場合は batch に応じたデフォルトの指示を使います。
+            model (str): 使用するAIモデル。
 
-    async def run(self) -> None:
-        """
-        エージェントのメインロジックを実行します。
-        0からmax_value-1までカウントアップし、各数値についてAIエージェントに
-        関連するテキストを問い合わせ、結果を出力関数に送信します。
-        処理完了後、EndOfMessageを送信します。
+        Returns:
+            Agent: 作成したAIエージェント。
         """
-        # 0 から max_value - 1 までカウントアップ
-        for i in range(self.max_value):
-            try:
-                # AI エージェントを起動し、応答を取得
-                # Runner.run は非同期関数と仮定
-                response = await Runner.run(
-                    self.agent,
-                    f'{{"number": {i}, "query": "この数字で連想するものは？"}}',
-                )
-                # JSON形式で送信しましたが、指示により応答は日本語文字列のはず
-
-                # メッセージを作成（カウント値 + AIの応答）
-                message = f"{i}: {response.final_output}"
-
-                # 出力コールバック関数を呼び出してメッセージを送信
-                await self.output_func(message)
-
-            except Exception as e:
-                # AI呼び出しなどでエラーが発生した場合
-                error_message = f"Error processing {i}: {e}"
-                await self.output_func(error_message)
-
-        # 全てのカウント処理が完了したら、終了マーカーを送信
-        await self.output_func(EndOfMessage())
-
-
-class QueuedCounterAgent(CounterAgent):
-    """
-    CounterAgentを拡張し、メッセージ送受信に非同期キュー(asyncio.Queue)を使用するクラス。
-    生成されたメッセージは内部キューに入れられ、外部から非同期に取得できます。
-
-    Attributes:
-        queue (asyncio.Queue): メッセージと終了マーカーを格納する非同期キュー。
-    """
+        if instructions is None:
+            instructions = (
+                cls.DEFAULT_BATCH_INSTRUCTIONS
+                if batch
+                else cls.DEFAULT_INSTRUCTIONS
+            )
+
+        # 同じ数値には同じ応答を返すよう temperature=0 にして、応答をキャッシュする
+        return Agent(
+            name=agent_name,
+            instructions=instructions,
+            model=model,
+            model_settings=ModelSettings(temperature=0.0),
+            output_type=list[CountAssociation] if batch else None,
+        )
 
-    def __init__(
-        self,
-        max_value: int = 10,
-        output_func: OutputFunc | None = None,
-        agent_name: str = CounterAgent.DEFAULT_AGENT_NAME,
-        instructions: str = CounterAgent.DEFAULT_INSTRUCTIONS,
-        model: str = CounterAgent.DEFAULT_MODEL,
-    ) -> None:
+    async def associate(self, i: int) -> str:
         """
-        QueuedCounterAgentを初期化します。
-        親クラスの初期化後、非同期キューを作成し、出力関数をキューへの送信メソッドに設定します。
+        数値についてAIエージェントに関連するテキストを問い合わせ、
+        出力用のメッセージを作成します。
 
         Args:
-            max_value (int): カウントアップする最大値。
-            output_func (OutputFunc | None): メッセージ出力用のコールバック関数（通常はNoneのまま）。
-                                              内部で `self.send_message` に上書きされます。
-            agent_name (str): AIエージェントの名前。
-            instructions (str): AIエージェントへの指示。
-            model (str): 使用するAIモデル。
-        """
-        # 親クラスのコンストラクタを呼び出し
-        # output_funcは後で上書きするので、ここではNoneを渡す
-        super().__init__(max_value, None, agent_name, instructions, model)
-
-        # メッセージ送受信用キューを作成
-        self.queue: asyncio.Queue[Union[str, EndOfMessage]] = asyncio.Queue()
-
-        # 出力関数を、メッセージをキューに入れるメソッドに設定
-        self.output_func = self.send_message
+            i (int): 問い合わせる数値。
 
-    async def send_message(self, message: Union[str, EndOfMessage]) -> None:
+        Returns:
+            str: カウント値とAIの応答、またはエラー内容を含むメッセージ。
         """
-        メッセージまたは終了マーカーを内部キューに追加します。
-        CounterAgentの`run`メソッドからコールバックとして呼び出されます。
-
-        Args:
-            message (Union[str, EndOfMessage]): キューに追加するメッセージまたは終了マーカー。
+        try:
+            # AI エージェントを起動し、応答を取得
+            final_output = await cached_final_output(
+                self.agent,
+                f'{{"number": {i}, "query": "この数字で連想するものは？"}}',
+            )
+            # JSON形式で送信しましたが、指示により応答は日本語文字列のはず
+
+        except Exception as e:
+            # AI呼び出しなどでエラーが発生した場合
+            return f"Error processing {i}: {e}"
+
+        # メッセージを作成（カウント値 + AIの応答）
+        return f"{i}: {final_output}"
+
+    async def run_batch(self) -> AsyncGenerator[str, None]:
         """
-        # メッセージまたは終了マーカーをキューに入れる
-        await self.queue.put(message)
+        0からmax_value-1までの全ての数値を1回の問い合わせでAIエージェントに送り、
+        数値ごとの連想結果をカウント順に生成(yield)します。
 
-    async def receive_message(self) -> AsyncGenerator[str, None]:
+        Yields:
+            str: カウント値とAIの応答、またはエラー内容を含むメッセージ。
+        """
+        numbers = list(range(self.max_value))
+        try:
+            final_output = await cached_final_output(
+                self.agent,
+                json.dumps(
+                    {
+                        "numbers": numbers,
+                        "query": "各数字について連想するものは？",
+                    },
+                    ensure_ascii=False,
+                ),
+            )
+        except Exception as e:
+            # AI呼び出しなどでエラーが発生した場合
+            yield f"Error processing {numbers}: {e}"
+            return
+
+        # 応答の並び順は保証されないので、カウント順に並べ替えて返す
+        for association in sorted(final_output, key=lambda x: x.index):
+            yield f"{association.index}: {association.text}"
+
+    async def run(self) -> AsyncGenerator[str, None]:
         """
-        内部キューからメッセージを非同期に受信し、生成(yield)します。
-        EndOfMessageを受け取るとループを終了します。
+        エージェントのメインロジックを実行します。
+        0からmax_value-1までの各数値についてAIエージェントに
+        関連するテキストを並行して問い合わせ、結果をカウント順に生成(yield)します。
+        batchが有効な場合は、全ての数値を1回の問い合わせで処理します。
 
         Yields:
-            str: キューから受信したメッセージ文字列。
+            str: カウント値とAIの応答、またはエラー内容を含むメッセージ。
         """
-        # 無限ループでキューを監視
-        while True:
-            # キューからメッセージを取り出す（キューが空の場合は待機）
-            message = await self.queue.get()
-
-            # キューからアイテムを取り出したことを通知 (キューの管理用)
-            self.queue.task_done()
-
-            # 終了マーカーを受け取った場合
-            if isinstance(message, EndOfMessage):
-                # ループを脱出してジェネレータを終了
-                break
-            elif isinstance(message, str):
-                # 文字列メッセージの場合、それをyieldして呼び出し元に返す
+        if self.batch:
+            async for message in self.run_batch():
                 yield message
-            else:
-                # 予期しない型のオブジェクトがキューに入っていた場合（エラーハンドリング）
-                raise ValueError(
-                    "QueuedCounterAgent: 予期しない型を受け取りました: "
-                    f"{type(message)}"
-                )
+            return
+
+        # 各数値の問い合わせは互いに独立しているので、一斉にタスクとして開始する
+        # 同時に実行される問い合わせの数は run_limited で制限される
+        tasks = [
+            asyncio.create_task(self.associate(i))
+            for i in range(self.max_value)
+        ]
+
+        try:
+            # 完了順ではなくカウント順に、メッセージを返す
+            for task in tasks:
+                yield await task
+        finally:
+            # 途中でキャンセルされたり、ジェネレータが閉じられたりした場合は、
+            # 残りの問い合わせをキャンセルする
+            # (asyncio.TaskGroup は Python 3.11 ではジェネレータの
+            #  GeneratorExit を例外グループに包んでしまうので使わない)
+            for task in tasks:
+                task.cancel()
+
+
+# CounterAgentが共通で使うAIエージェント
+counter_agent = CounterAgent.create_agent()
+batch_counter_agent = CounterAgent.create_agent(batch=True)
 
 
 async def respond(
-    message: str, chat_history: ChatHistory
+    message: str, chat_history: ChatHistory, batch: bool = False
 ) -> AsyncGenerator[tuple[str, ChatHistory], None]:
     """
     Gradioのチャットインターフェースからの入力に応答する非同期ジェネレータ関数。
 
-    ユーザーのメッセージを受け取り、QueuedCounterAgentをバックグラウンドで実行し、
+    ユーザーのメッセージを受け取り、CounterAgentを実行し、
     エージェントが生成するメッセージをストリーミングでチャット履歴に追加してUIに反映します。
 
     Args:
         message (str): ユーザーが入力したメッセージ文字列。
         chat_history (ChatHistory): これまでの会話履歴のリスト。
+        batch (bool): Trueの場合、全ての数値を1回の問い合わせで処理します。
 
     Yields:
         tuple[str, ChatHistory]: 更新されたUI状態。空の入力テキストと更新されたチャット履歴。
@@ -237,35 +316,33 @@ async def respond(
     )
     yield "", chat_history
 
-    # 3. QueuedCounterAgentインスタンスを作成
+    # 3. CounterAgentインスタンスを作成
     #    max_valueなどはここで設定する
-    counter = QueuedCounterAgent(max_value=5)
-
-    # 4. CounterAgentのrunメソッドをバックグラウンドタスクとして実行
-    #    これにより、runメソッドの完了を待たずに次の処理に進める
-    counter_task = asyncio.create_task(counter.run())
-
-    # 5. エージェントのキューからメッセージを非同期に受信し、チャット履歴に追加するループ
-    #    counter.receive_message() は非同期ジェネレータ
-    async for agent_response in counter.receive_message():
-        # アシスタントの応答を会話履歴に追加
-        chat_history.append({"role": "assistant", "content": agent_response})
-        # UI（チャット履歴）を更新
-        yield "", chat_history
-
-    # 6. バックグラウンドタスク(counter.run)の完了を待つ
-    #    receive_messageループが終了するのはEndOfMessageを受け取った後なので、
-    #    通常、この時点ではcounter_taskは完了しているはずだが、念のため待つ。
+    #    batch は UI のチェックボックスで切り替える
+    counter = CounterAgent(max_value=5, batch=batch)
+
+    # 4. CounterAgentのrunメソッドからメッセージを非同期に受信し、
+    #    チャット履歴に追加するループ
+    #    counter.run() は非同期ジェネレータ
+    #    クライアントの切断などで respond が中断された場合にも
+    #    counter.run() を確実に閉じ、残りの問い合わせをキャンセルする
     try:
-        await counter_task
+        async with aclosing(counter.run()) as agent_responses:
+            async for agent_response in agent_responses:
+                # アシスタントの応答を会話履歴に追加
+                chat_history.append(
+                    {"role": "assistant", "content": agent_response}
+                )
+                # UI（チャット履歴）を更新
+                yield "", chat_history
     except Exception as e:
-        # counter_task内で捕捉されなかった例外があればここで処理
+        # counter.run内で捕捉されなかった例外があればここで処理
         chat_history.append(
             {"role": "assistant", "content": f"エラーが発生しました: {e}"}
         )
         yield "", chat_history
 
-    # 7. 全ての処理が完了したことを示すメッセージを追加
+    # 5. 全ての処理が完了したことを示すメッセージを追加
     chat_history.append({"role": "assistant", "content": "カウント終了です。"})
     yield "", chat_history
 
@@ -299,6 +376,11 @@ with gr.Blocks() as demo:
             "送信", variant="primary", scale=1
         )  # variant="primary"で目立たせる
 
+    # 問い合わせ方法の切り替え
+    batch_checkbox = gr.Checkbox(
+        label="全ての数値を1回の問い合わせにまとめる", value=False
+    )
+
     # クリアボタン
     clear_button = gr.ClearButton(
         [msg_textbox, chatbot], value="チャット履歴をクリア"
@@ -309,12 +391,20 @@ with gr.Blocks() as demo:
     gr.on(
         triggers=[msg_textbox.submit, submit_button.click],
         fn=respond,  # 実行する関数
-        inputs=[msg_textbox, chatbot],  # 関数への入力
+        inputs=[msg_textbox, chatbot, batch_checkbox],  # 関数への入力
         outputs=[msg_textbox, chatbot],  # 関数の出力先 (UIコンポーネント)
     ).then(
         lambda: "", outputs=[msg_textbox]
     )  # 送信後テキストボックスをクリア
 
+# --- キューの設定 ---
+# respond は LLM の API 待ちがほとんどの非同期関数なので、
+# 複数ユーザーのリクエストを同時に処理する
+# default_concurrency_limit: イベントごとの同時実行数
+# max_size: 待ち行列の上限
+# api_open=False: キューを経由しない API からの直接呼び出しを禁止
+demo.queue(default_concurrency_limit=16, max_size=64, api_open=False)
+
 
 if __name__ == "__main__":
     # Gradioアプリケーションを起動
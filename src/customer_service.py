@@ -2,6 +2,7 @@ from __future__ import annotations as _annotations
 
 import asyncio
 import random
+import re
 import uuid
 
 from agents import (
@@ -10,6 +11,7 @@ from agents import (
     ItemHelpers,
     MessageOutputItem,
     RunContextWrapper,
+    RunItem,
     Runner,
     ToolCallItem,
     ToolCallOutputItem,
@@ -34,27 +36,52 @@ class AirlineAgentContext(BaseModel):
 # TOOLS
 
 
+# FAQ のカテゴリごとのキーワード (先に書いたカテゴリほど優先)
+FAQ_KEYWORDS = {
+    "bag": ("バッグ", "荷物"),
+    "seat": ("席", "飛行機"),
+    "wifi": ("wifi",),
+}
+
+FAQ_ANSWERS = {
+    "bag": (
+        "飛行機にはバッグを1個持ち込むことができます。"
+        "重量は50ポンド以下、サイズは22インチ×14インチ×9インチである必要があります。"
+    ),
+    "seat": (
+        "飛行機には120席あります。"
+        "ビジネスクラスは22席、エコノミークラスは98席あります。"
+        "非常口は4列目と16列目です。"
+        "5～8 列目はエコノミープラスで、足元スペースが広くなっています。"
+    ),
+    "wifi": "飛行機には無料Wi-Fiがあります。Airline-Wifiにご参加ください",
+}
+
+FAQ_UNKNOWN_ANSWER = "申し訳ありませんが、その質問の答えはわかりません。"
+
+# 全てのキーワードを1つの正規表現にまとめ、質問文を1回の走査で照合する
+_FAQ_CATEGORY_BY_KEYWORD = {
+    keyword: category
+    for category, keywords in FAQ_KEYWORDS.items()
+    for keyword in keywords
+}
+_FAQ_PRIORITY = {category: i for i, category in enumerate(FAQ_KEYWORDS)}
+_FAQ_PATTERN = re.compile("|".join(map(re.escape, _FAQ_CATEGORY_BY_KEYWORD)))
+
+
 @function_tool(
     name_override="faq_lookup_tool",
     description_override="よく聞かれる質問",
 )
 async def faq_lookup_tool(question: str) -> str:
     print(f"faq_lookup_tool question: {question}")
-    if "バッグ" in question or "荷物" in question:
-        return (
-            "飛行機にはバッグを1個持ち込むことができます。"
-            "重量は50ポンド以下、サイズは22インチ×14インチ×9インチである必要があります。"
-        )
-    elif "席" in question or "飛行機" in question:
-        return (
-            "飛行機には120席あります。"
-            "ビジネスクラスは22席、エコノミークラスは98席あります。"
-            "非常口は4列目と16列目です。"
-            "5～8 列目はエコノミープラスで、足元スペースが広くなっています。"
-        )
-    elif "wifi" in question:
-        return "飛行機には無料Wi-Fiがあります。Airline-Wifiにご参加ください"
-    return "申し訳ありませんが、その質問の答えはわかりません。"
+    categories = {
+        _FAQ_CATEGORY_BY_KEYWORD[match.group(0)]
+        for match in _FAQ_PATTERN.finditer(question)
+    }
+    if not categories:
+        return FAQ_UNKNOWN_ANSWER
+    return FAQ_ANSWERS[min(categories, key=_FAQ_PRIORITY.__getitem__)]
 
 
 @function_tool
@@ -80,34 +107,31 @@ async def update_seat(
 
 # HOOKS
 
+# モジュール共有の random ではなく、フライト番号専用の乱数生成器を使う
+_flight_number_rng = random.Random()
+
 
 async def on_seat_booking_handoff(
     context: RunContextWrapper[AirlineAgentContext],
 ) -> None:
-    flight_number = f"FLT-{random.randint(100, 999)}"
+    flight_number = f"FLT-{_flight_number_rng.randrange(100, 1000)}"
     context.context.flight_number = flight_number
 
 
-# AGENTS
+# INSTRUCTIONS
 
-faq_agent = Agent[AirlineAgentContext](
-    name="FAQエージェント",
-    handoff_description="航空会社に関する質問に答えてくれる親切なエージェント",
-    instructions=f"""{RECOMMENDED_PROMPT_PREFIX}
+# エージェントの指示はユーザーによらない固定の文字列にして、
+# 会話ごとの情報 (座席番号など) はコンテキストやツールの結果で扱う
+FAQ_AGENT_INSTRUCTIONS = f"""{RECOMMENDED_PROMPT_PREFIX}
     あなたは FAQ エージェントです。顧客と話しているときは、
     トリアージ エージェントから転送された可能性があります。
     次のルーチンを使用して顧客をサポートします。
     # ルーチン
     1. 顧客が最後に尋ねた質問を特定します。
     2. FAQ 検索ツール'faq_lookup_tool'を使用して質問に答えます。自分の知識に頼らないでください。
-    3. 質問に答えられない場合は、トリアージ エージェントに転送します。""",
-    tools=[faq_lookup_tool],
-)
+    3. 質問に答えられない場合は、トリアージ エージェントに転送します。"""
 
-seat_booking_agent = Agent[AirlineAgentContext](
-    name="座席予約エージェント",
-    handoff_description="フライトの座席を更新できる便利なエージェント。",
-    instructions=f"""{RECOMMENDED_PROMPT_PREFIX}
+SEAT_BOOKING_AGENT_INSTRUCTIONS = f"""{RECOMMENDED_PROMPT_PREFIX}
     あなたは座席予約エージェントです。顧客と話しているときは、
     トリアージ エージェントから転送された可能性があります。
     次のルーチンを使用して顧客をサポートします。
@@ -115,18 +139,35 @@ seat_booking_agent = Agent[AirlineAgentContext](
     1. 確認番号を尋ねます。
     2. 顧客に希望の座席番号を尋ねます。
     3. 座席更新ツール'update_seat'を使用して、フライトの座席を更新します。
-    顧客がルーチンに関係のない質問をした場合は、トリアージ エージェントに転送します。""",
+    顧客がルーチンに関係のない質問をした場合は、トリアージ エージェントに転送します。"""
+
+TRIAGE_AGENT_INSTRUCTIONS = (
+    f"{RECOMMENDED_PROMPT_PREFIX} "
+    "あなたは役に立つトリアージエージェントです。ツールを使用して、"
+    "質問を他の適切なエージェントに委任することができます。"
+)
+
+
+# AGENTS
+
+faq_agent = Agent[AirlineAgentContext](
+    name="FAQエージェント",
+    handoff_description="航空会社に関する質問に答えてくれる親切なエージェント",
+    instructions=FAQ_AGENT_INSTRUCTIONS,
+    tools=[faq_lookup_tool],
+)
+
+seat_booking_agent = Agent[AirlineAgentContext](
+    name="座席予約エージェント",
+    handoff_description="フライトの座席を更新できる便利なエージェント。",
+    instructions=SEAT_BOOKING_AGENT_INSTRUCTIONS,
     tools=[update_seat],
 )
 
 triage_agent = Agent[AirlineAgentContext](
     name="トリアージエージェント",
     handoff_description="顧客のリクエストを適切なエージェントに委任できるトリアージエージェント",
-    instructions=(
-        f"{RECOMMENDED_PROMPT_PREFIX} "
-        "あなたは役に立つトリアージエージェントです。ツールを使用して、"
-        "質問を他の適切なエージェントに委任することができます。"
-    ),
+    instructions=TRIAGE_AGENT_INSTRUCTIONS,
     handoffs=[
         faq_agent,
         handoff(agent=seat_booking_agent, on_handoff=on_seat_booking_handoff),
@@ -137,6 +178,28 @@ faq_agent.handoffs.append(triage_agent)
 seat_booking_agent.handoffs.append(triage_agent)
 
 
+# DISPLAY
+
+# 実行結果のアイテムの型ごとの表示方法
+NEW_ITEM_FORMATTERS = {
+    MessageOutputItem: lambda item: (
+        f"{item.agent.name}: {ItemHelpers.text_message_output(item)}"
+    ),
+    HandoffOutputItem: lambda item: (
+        f"Handed off from {item.source_agent.name}"
+        f" to {item.target_agent.name}"
+    ),
+    ToolCallItem: lambda item: f"{item.agent.name}: ツール呼び出し",
+    ToolCallOutputItem: lambda item: (
+        f"{item.agent.name}: ツール呼び出し結果: {item.output}"
+    ),
+}
+
+
+def format_skipped_item(item: RunItem) -> str:
+    return f"{item.agent.name}: スキップ: {item.__class__.__name__}"
+
+
 # RUN
 
 
@@ -152,7 +215,10 @@ async def main():
 
     while True:
         print(f"context: {context}")
-        user_input = input(">>> メッセージをお願いします: ")
+        # 入力待ちでイベントループを止めないよう別スレッドで読む
+        user_input = await asyncio.to_thread(
+            input, ">>> メッセージをお願いします: "
+        )
         with trace("カスタマーサービス", group_id=conversation_id):
             input_items.append({"content": user_input, "role": "user"})
             result = await Runner.run(
@@ -160,27 +226,10 @@ async def main():
             )
 
             for new_item in result.new_items:
-                agent_name = new_item.agent.name
-                if isinstance(new_item, MessageOutputItem):
-                    print(
-                        f"{agent_name}: "
-                        f"{ItemHelpers.text_message_output(new_item)}"
-                    )
-                elif isinstance(new_item, HandoffOutputItem):
-                    print(
-                        f"Handed off from {new_item.source_agent.name}"
-                        f" to {new_item.target_agent.name}"
-                    )
-                elif isinstance(new_item, ToolCallItem):
-                    print(f"{agent_name}: ツール呼び出し")
-                elif isinstance(new_item, ToolCallOutputItem):
-                    print(
-                        f"{agent_name}: ツール呼び出し結果: {new_item.output}"
-                    )
-                else:
-                    print(
-                        f"{agent_name}: スキップ: {new_item.__class__.__name__}"
-                    )
+                formatter = NEW_ITEM_FORMATTERS.get(
+                    type(new_item), format_skipped_item
+                )
+                print(formatter(new_item))
             input_items = result.to_input_list()
             current_agent = result.last_agent
 
@@ -11,17 +11,22 @@ class CustomContext:
         self.style = style
 
 
+# スタイルによらない部分を先頭に固定して、プロンプトキャッシュを効かせる
+STYLE_INSTRUCTIONS = (
+    "末尾の「スタイル: ...」に応じて次のようにレスポンスして。\n"
+    "- 俳句: 俳句のみをレスポンスして\n"
+    "- 海賊: 海賊のようにレスポンスして\n"
+    "- ロボット: ロボットのようにレスポンスして。'ピコ' と音を出す感じ"
+)
+
+
 def custom_instructions(
     run_context: RunContextWrapper[CustomContext], agent: Agent[CustomContext]
 ) -> str:
     context = run_context.context
     pprint(run_context)
-    if context.style == "俳句":
-        return "俳句のみをレスポンスして"
-    elif context.style == "海賊":
-        return "海賊のようにレスポンスして"
-    else:
-        return "ロボットのようにレスポンスして。'ピコ' と音を出す感じ"
+    # 変わるのはスタイルの行だけなので、固定の先頭部分はキャッシュされる
+    return f"{STYLE_INSTRUCTIONS}\n\nスタイル: {context.style}"
 
 
 agent = Agent(
@@ -1,4 +1,8 @@
 import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
 from dataclasses import asdict
 from pprint import pprint
 
@@ -30,9 +34,30 @@ history_tutor_agent = Agent(
 )
 
 
+# 同じ入力に対するガードレールの判定結果のキャッシュ (古いものから破棄)
+GUARDRAIL_CACHE_SIZE = 1024
+_guardrail_cache: OrderedDict[str, HomeworkOutput] = OrderedDict()
+
+
+def _guardrail_cache_key(input_data) -> str:
+    if not isinstance(input_data, str):
+        input_data = json.dumps(input_data, ensure_ascii=False, default=str)
+    return hashlib.blake2b(input_data.encode(), digest_size=16).hexdigest()
+
+
 async def homework_guardrail(ctx, agent, input_data):
-    result = await Runner.run(guardrail_agent, input_data, context=ctx.context)
-    final_output = result.final_output_as(HomeworkOutput)
+    key = _guardrail_cache_key(input_data)
+    if key in _guardrail_cache:
+        _guardrail_cache.move_to_end(key)
+        final_output = _guardrail_cache[key]
+    else:
+        result = await Runner.run(
+            guardrail_agent, input_data, context=ctx.context
+        )
+        final_output = result.final_output_as(HomeworkOutput)
+        _guardrail_cache[key] = final_output
+        if len(_guardrail_cache) > GUARDRAIL_CACHE_SIZE:
+            _guardrail_cache.popitem(last=False)
     return GuardrailFunctionOutput(
         output_info=final_output,
         tripwire_triggered=not final_output.is_homework,
@@ -49,6 +74,24 @@ triage_agent = Agent(
 )
 
 
+# 同時に問い合わせる質問数の上限 (環境変数 LLM_CONCURRENCY で変更できる)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+
+async def run_limited(agent, input_data):
+    async with llm_semaphore:
+        return await Runner.run(agent, input_data)
+
+
+QUESTIONS = [
+    "これは宿題ではないですが、二人の擲弾兵という曲について教えて。",
+    "アメリカの最初の大統領は誰？",
+    "アメリカ最初の大統領の人生は？",
+    "宿題じゃなくて自己学習ですが、特異値分解と主成分分析の関係は？",
+]
+
+
 async def main():
     pprint([x for x in dir(triage_agent) if not x.startswith("_")])
     pprint(asdict(triage_agent))
@@ -56,50 +99,21 @@ async def main():
     pprint([x for x in dir(guardrail_agent) if not x.startswith("_")])
     pprint(asdict(guardrail_agent))
 
-    try:
-        result = await Runner.run(
-            triage_agent,
-            "これは宿題ではないですが、二人の擲弾兵という曲について教えて。",
-        )
-        print(result.final_output)
-        pprint([x for x in dir(result) if not x.startswith("_")])
-        pprint(asdict(result))
-
-    except Exception as e:
-        print(e)
-
-    try:
-        result = await Runner.run(triage_agent, "アメリカの最初の大統領は誰？")
-        print(result.final_output)
-        pprint([x for x in dir(result) if not x.startswith("_")])
-        pprint(asdict(result))
-
-    except Exception as e:
-        print(e)
-
-    try:
-        result = await Runner.run(
-            triage_agent, "アメリカ最初の大統領の人生は？"
-        )
-        print(result.final_output)
-        pprint([x for x in dir(result) if not x.startswith("_")])
-        pprint(asdict(result))
+    # 各質問は互いに独立しているので、同時に問い合わせる
+    results = await asyncio.gather(
+        *[run_limited(triage_agent, question) for question in QUESTIONS],
+        return_exceptions=True,
+    )
 
-    except Exception as e:
-        print(e)
+    for result in results:
+        if isinstance(result, Exception):
+            print(result)
+            continue
 
-    try:
-        result = await Runner.run(
-            triage_agent,
-            "宿題じゃなくて自己学習ですが、特異値分解と主成分分析の関係は？",
-        )
         print(result.final_output)
         pprint([x for x in dir(result) if not x.startswith("_")])
         pprint(asdict(result))
 
-    except Exception as e:
-        print(e)
-
 
 if __name__ == "__main__":
     asyncio.run(main())
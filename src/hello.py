@@ -1,3 +1,5 @@
+import asyncio
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,7 +9,16 @@ from agents import Agent, Runner  # noqa: E402
 agent = Agent(
     name="アシスタント", instructions="あなたはとても親切なアシスタントです"
 )
-result = Runner.run_sync(
-    agent, "今夜の夕飯のメニューを考えて。豚肉と野菜があります。"
-)
-print(result.final_output)
+
+
+async def main():
+    result = await Runner.run(
+        agent, "今夜の夕飯のメニューを考えて。豚肉と野菜があります。"
+    )
+    print(result.final_output)
+    return result
+
+
+if __name__ == "__main__":
+    # make hello は python -i で起動するので、result を REPL から参照できるようにする
+    result = asyncio.run(main())
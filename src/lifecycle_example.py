@@ -1,5 +1,10 @@
 import asyncio
+import itertools
+import logging
+import queue
 import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
 from typing import Any
 
 from agents import (
@@ -14,117 +19,187 @@ from agents import (
 )
 from pydantic import BaseModel
 
+# フックのイベントを出力するロガー
+# メッセージの整形は %s 形式で遅延させ、出力は start_hook_logging で設定する
+logger = logging.getLogger(__name__)
+
+
+def start_hook_logging() -> QueueListener:
+    """フックのログを別スレッドで標準出力へ書き出すように設定する
+
+    フックではキューにログを積むだけにして、標準出力への書き込みで
+    イベントループを止めないようにする
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+    return listener
+
 
 class CustomAgentHooks(AgentHooks):
     def __init__(self, display_name: str):
-        self.event_counter = 0
+        # イベントの通し番号
+        self._next_event_number = itertools.count(1).__next__
         self.display_name = display_name
 
     async def on_start(self, context: RunContextWrapper, agent: Agent) -> None:
-        self.event_counter += 1
-        print(
-            f"### AH {self.display_name} {self.event_counter}: "
-            f"Agent {agent.name} started"
+        n = self._next_event_number()
+        logger.info(
+            "### AH %s %s: Agent %s started",
+            self.display_name,
+            n,
+            agent.name,
         )
 
     async def on_end(
         self, context: RunContextWrapper, agent: Agent, output: Any
     ) -> None:
-        self.event_counter += 1
-        print(
-            f"### AH {self.display_name} {self.event_counter}: "
-            f"Agent {agent.name} ended with output {output}"
+        n = self._next_event_number()
+        logger.info(
+            "### AH %s %s: Agent %s ended with output %s",
+            self.display_name,
+            n,
+            agent.name,
+            output,
         )
 
     async def on_handoff(
         self, context: RunContextWrapper, agent: Agent, source: Agent
     ) -> None:
-        self.event_counter += 1
-        print(
-            f"### AH {self.display_name} {self.event_counter}: "
-            f"Agent {source.name} handed off to {agent.name}"
+        n = self._next_event_number()
+        logger.info(
+            "### AH %s %s: Agent %s handed off to %s",
+            self.display_name,
+            n,
+            source.name,
+            agent.name,
         )
 
     async def on_tool_start(
         self, context: RunContextWrapper, agent: Agent, tool: Tool
     ) -> None:
-        self.event_counter += 1
-        print(
-            f"### AH {self.display_name} {self.event_counter}: "
-            f"Agent {agent.name} started tool {tool.name}"
+        n = self._next_event_number()
+        logger.info(
+            "### AH %s %s: Agent %s started tool %s",
+            self.display_name,
+            n,
+            agent.name,
+            tool.name,
         )
 
     async def on_tool_end(
         self, context: RunContextWrapper, agent: Agent, tool: Tool, result: str
     ) -> None:
-        self.event_counter += 1
-        print(
-            f"### AH {self.display_name} {self.event_counter}: "
-            f"Agent {agent.name} ended tool {tool.name} with result {result}"
+        n = self._next_event_number()
+        logger.info(
+            "### AH %s %s: Agent %s ended tool %s with result %s",
+            self.display_name,
+            n,
+            agent.name,
+            tool.name,
+            result,
         )
 
 
 class CustomRunHooks(RunHooks):
     def __init__(self):
-        self.event_counter = 0
+        # イベントの通し番号
+        self._next_event_number = itertools.count(1).__next__
+        # Usage は LLM へのリクエストごとにしか変わらないので整形結果を使い回す
+        self._usage_cache: tuple[int, int, int, int] | None = None
+        self._usage_str: str = ""
 
     def _usage_to_str(self, usage: Usage) -> str:
-        return (
-            f"{usage.requests} requests, {usage.input_tokens} input tokens, "
-            f"{usage.output_tokens} output tokens, {usage.total_tokens}"
-            " total tokens"
+        key = (
+            usage.requests,
+            usage.input_tokens,
+            usage.output_tokens,
+            usage.total_tokens,
         )
+        if key != self._usage_cache:
+            self._usage_cache = key
+            self._usage_str = (
+                f"{usage.requests} requests, {usage.input_tokens} input "
+                f"tokens, {usage.output_tokens} output tokens, "
+                f"{usage.total_tokens} total tokens"
+            )
+        return self._usage_str
 
     async def on_agent_start(
         self, context: RunContextWrapper, agent: Agent
     ) -> None:
-        self.event_counter += 1
-        print(
-            f"### RH {self.event_counter}: Agent {agent.name} started. "
-            f"Usage: {self._usage_to_str(context.usage)}"
-        )
+        n = self._next_event_number()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "### RH %s: Agent %s started. Usage: %s",
+                n,
+                agent.name,
+                self._usage_to_str(context.usage),
+            )
 
     async def on_agent_end(
         self, context: RunContextWrapper, agent: Agent, output: Any
     ) -> None:
-        self.event_counter += 1
-        print(
-            f"### RH {self.event_counter}: Agent {agent.name} ended with "
-            f"output {output}. Usage: {self._usage_to_str(context.usage)}"
-        )
+        n = self._next_event_number()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "### RH %s: Agent %s ended with output %s. Usage: %s",
+                n,
+                agent.name,
+                output,
+                self._usage_to_str(context.usage),
+            )
 
     async def on_tool_start(
         self, context: RunContextWrapper, agent: Agent, tool: Tool
     ) -> None:
-        self.event_counter += 1
-        print(
-            f"### RH {self.event_counter}: Tool {tool.name} started. Usage: "
-            f"{self._usage_to_str(context.usage)}"
-        )
+        n = self._next_event_number()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "### RH %s: Tool %s started. Usage: %s",
+                n,
+                tool.name,
+                self._usage_to_str(context.usage),
+            )
 
     async def on_tool_end(
         self, context: RunContextWrapper, agent: Agent, tool: Tool, result: str
     ) -> None:
-        self.event_counter += 1
-        print(
-            f"### RH {self.event_counter}: Tool {tool.name} ended with "
-            f"result {result}. Usage: {self._usage_to_str(context.usage)}"
-        )
+        n = self._next_event_number()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "### RH %s: Tool %s ended with result %s. Usage: %s",
+                n,
+                tool.name,
+                result,
+                self._usage_to_str(context.usage),
+            )
 
     async def on_handoff(
         self, context: RunContextWrapper, from_agent: Agent, to_agent: Agent
     ) -> None:
-        self.event_counter += 1
-        print(
-            f"### RH {self.event_counter}: Handoff from {from_agent.name} to "
-            f"{to_agent.name}. Usage: {self._usage_to_str(context.usage)}"
-        )
+        n = self._next_event_number()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "### RH %s: Handoff from %s to %s. Usage: %s",
+                n,
+                from_agent.name,
+                to_agent.name,
+                self._usage_to_str(context.usage),
+            )
+
+
+# 乱数生成器はモジュールで一つだけ作って使い回す
+_rng = random.Random()
 
 
 @function_tool
 def random_number(max: int) -> int:
     """指定された最大値までの乱数を生成します"""
-    return random.randint(0, max)
+    return _rng.randrange(max + 1)
 
 
 @function_tool
@@ -156,12 +231,18 @@ orchestration_agent = Agent(
 
 
 async def main() -> None:
-    user_input = input("最大数を入力してください: ")
-    await Runner.run(
-        orchestration_agent,
-        hooks=CustomRunHooks(),
-        input=f"0 から {user_input} までのランダムな整数を生成して。",
-    )
+    # 入力待ちでイベントループを止めないよう別スレッドで読む
+    user_input = await asyncio.to_thread(input, "最大数を入力してください: ")
+    listener = start_hook_logging()
+    try:
+        await Runner.run(
+            orchestration_agent,
+            hooks=CustomRunHooks(),
+            input=f"0 から {user_input} までのランダムな整数を生成して。",
+        )
+    finally:
+        # キューに残っているログを全て書き出してから終了する
+        listener.stop()
     print("Done!")
 
 
@@ -24,7 +24,10 @@ async def run(mcp_server: MCPServer):
     print(result.final_output)
 
     while True:
-        message = input("Elasticsearch で何がしたいですか？")
+        # 入力待ちの間も MCP サーバーとの通信を止めないよう別スレッドで読む
+        message = await asyncio.to_thread(
+            input, "Elasticsearch で何がしたいですか？"
+        )
         print(f"命令: {message}")
         result = await Runner.run(starting_agent=agent, input=message)
         print(result.final_output)
@@ -35,6 +38,7 @@ async def main():
 
     async with MCPServerStdio(
         name="MCP Elasticsearch",
+        cache_tools_list=True,  # 接続中はツール一覧を使い回す
         params={
             "command": "uv",
             "args": [
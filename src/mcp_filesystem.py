@@ -5,6 +5,16 @@ import shutil
 from agents import Agent, Runner, gen_trace_id, trace
 from agents.mcp import MCPServer, MCPServerStdio
 
+# 同じ MCP サーバーへ同時に問い合わせる質問数の上限
+# (環境変数 LLM_CONCURRENCY で変更できる)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+
+async def run_limited(agent, input_data):
+    async with llm_semaphore:
+        return await Runner.run(starting_agent=agent, input=input_data)
+
 
 async def run(mcp_server: MCPServer):
     """エージェントの定義と実行"""
@@ -15,29 +25,35 @@ async def run(mcp_server: MCPServer):
         mcp_servers=[mcp_server],
     )
 
-    # ファイルの一覧
-    message = "ファイルの一覧を取得して。"
-    print(f"実行中: {message}")
-    result = await Runner.run(starting_agent=agent, input=message)
-    print(result.final_output)
+    messages = [
+        # ファイルの一覧
+        "ファイルの一覧を取得して。",
+        # 書籍についての質問
+        (
+            "ファイルの一覧を取得して、好きな書籍のファイルを見て。"
+            "私が最初に挙げている書籍は？"
+        ),
+        # 理由に関する質問
+        (
+            "ファイルの一覧を取得して、好きな歌のファイルを見て。"
+            "私が好きそうな新しい歌をサジェストして。"
+        ),
+    ]
 
-    # 書籍についての質問
-    message = (
-        "ファイルの一覧を取得して、好きな書籍のファイルを見て。"
-        "私が最初に挙げている書籍は？"
+    # 各質問は互いに独立しているので、同じ MCP サーバーに同時に問い合わせる
+    # 一つの質問が失敗しても、他の質問の回答は捨てずに表示する
+    results = await asyncio.gather(
+        *[run_limited(agent, m) for m in messages], return_exceptions=True
     )
-    print(f"\n\n実行中: {message}")
-    result = await Runner.run(starting_agent=agent, input=message)
-    print(result.final_output)
-
-    # 理由に関する質問
-    message = (
-        "ファイルの一覧を取得して、好きな歌のファイルを見て。"
-        "私が好きそうな新しい歌をサジェストして。"
-    )
-    print(f"\n\n実行中: {message}")
-    result = await Runner.run(starting_agent=agent, input=message)
-    print(result.final_output)
+
+    # 結果は質問の順に表示
+    for message, result in zip(messages, results):
+        print(f"実行中: {message}")
+        if isinstance(result, Exception):
+            print(result, end="\n\n\n")
+            continue
+
+        print(result.final_output, end="\n\n\n")
 
 
 async def main():
@@ -47,6 +63,7 @@ async def main():
 
     async with MCPServerStdio(
         name="MCP ファイルシステムサーバー",
+        cache_tools_list=True,  # 接続中はツール一覧を使い回す
         params={
             "command": "npx",
             "args": [
@@ -18,7 +18,10 @@ async def run(mcp_server: MCPServer):
     )
 
     while True:
-        message = input("YFinance で何がしたいですか？")
+        # 入力待ちの間も MCP サーバーとの通信を止めないよう別スレッドで読む
+        message = await asyncio.to_thread(
+            input, "YFinance で何がしたいですか？"
+        )
         print(f"命令: {message}")
         result = await Runner.run(starting_agent=agent, input=message)
         print(result.final_output)
@@ -29,12 +32,13 @@ async def main():
 
     async with MCPServerStdio(
         name="MCP YFinance",
+        cache_tools_list=True,  # 接続中はツール一覧を使い回す
         params={
             "command": "uvx",
             "args": [
                 "yfmcp@latest",
-            ]
-        }
+            ],
+        },
     ) as server:
         trace_id = gen_trace_id()
         with trace(workflow_name="MCP YFinance", trace_id=trace_id):
@@ -1,8 +1,22 @@
 import asyncio
+import sys
+import time
 
 from agents import Agent, Runner
 from openai.types.responses import ResponseTextDeltaEvent
 
+# 差分をまとめて書き出す条件 (差分の個数と経過秒数)
+FLUSH_DELTAS = 32
+FLUSH_INTERVAL = 0.01
+
+
+def flush(buffer: list[str]) -> None:
+    """溜めた差分をまとめて標準出力に書き出す"""
+    if buffer:
+        sys.stdout.write("".join(buffer))
+        sys.stdout.flush()
+        buffer.clear()
+
 
 async def main():
     agent = Agent(
@@ -11,11 +25,26 @@ async def main():
     )
 
     result = Runner.run_streamed(agent, input="5個の冗談を言って。")
+
+    # 差分ごとに flush せず、ある程度まとめてから標準出力に書き出す
+    buffer: list[str] = []
+    last_flush = time.monotonic()
     async for event in result.stream_events():
         if event.type == "raw_response_event" and isinstance(
             event.data, ResponseTextDeltaEvent
         ):
-            print(event.data.delta, end="", flush=True)
+            buffer.append(event.data.delta)
+            now = time.monotonic()
+            if (
+                len(buffer) >= FLUSH_DELTAS
+                or now - last_flush >= FLUSH_INTERVAL
+                or "\n" in event.data.delta
+            ):
+                flush(buffer)
+                last_flush = now
+
+    # 残りを書き出す
+    flush(buffer)
 
 
 if __name__ == "__main__":
@@ -1,20 +1,55 @@
+import asyncio
 import datetime
+import functools
+import os
+import time
 
 import mlflow
 from agents import Agent, Runner, WebSearchTool, function_tool
 
-mlflow.set_experiment("tools")
-mlflow.openai.autolog()
+_mlflow_initialized = False
+
+
+def _init_mlflow() -> None:
+    """MLflow のトレースを設定する (何度呼んでも一度だけ実行)
+
+    トラッキングサーバーへの通信が発生するので import 時には行わない
+    """
+    global _mlflow_initialized
+    if _mlflow_initialized:
+        return
+    mlflow.set_experiment("tools")
+    mlflow.openai.autolog()
+    _mlflow_initialized = True
+
+
+# 現在時刻の文字列を使い回す期間 (秒)
+DATETIME_TTL = 1.0
+
+_datetime_cache: tuple[float, str] = (float("-inf"), "")
+
+
+@functools.lru_cache(maxsize=128)
+def _weather_of(city: str) -> str:
+    """都市ごとの天気 (同じ都市なら同じ結果なのでキャッシュする)"""
+    return f"{city} の天気は雪です"
 
 
 @function_tool(description_override="指定の都市の天気を返す関数です")
 def get_weather(city: str) -> str:
-    return f"{city} の天気は雪です"
+    return _weather_of(city)
 
 
 @function_tool(description_override="現在時刻を返す関数です")
 def get_datetime(city: str) -> str:
-    return str(datetime.datetime.now())
+    # 同じ問い合わせの中で何度も呼ばれるので、短い間は同じ結果を返す
+    global _datetime_cache
+    checked_at, now = _datetime_cache
+    t = time.monotonic()
+    if t - checked_at >= DATETIME_TTL:
+        now = str(datetime.datetime.now())
+        _datetime_cache = (t, now)
+    return now
 
 
 agent = Agent(
@@ -24,22 +59,43 @@ agent = Agent(
     tools=[get_weather, get_datetime, WebSearchTool()],
 )
 
-result = Runner.run_sync(agent, "今月の秋月電子の定番キットは？")
-print(result.final_output + "\n")
+QUESTIONS = [
+    "今月の秋月電子の定番キットは？",
+    "今年の5月に開催されるビッグイベントは？",
+    "沖縄の天気知ってる？",
+    "昨日って何月何日だったっけ？",
+    "沖縄の名物料理を知ってる？",
+    "今夜の夕飯のメニューを考えて。豚肉と野菜があります。",
+]
 
-result = Runner.run_sync(agent, "今年の5月に開催されるビッグイベントは？")
-print(result.final_output + "\n")
+# LLM API のレート制限を考慮した同時問い合わせ数の上限
+# (環境変数 LLM_CONCURRENCY で変更できる)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
 
-result = Runner.run_sync(agent, "沖縄の天気知ってる？")
-print(result.final_output + "\n")
 
-result = Runner.run_sync(agent, "昨日って何月何日だったっけ？")
-print(result.final_output + "\n")
+async def run_limited(agent, input_data):
+    async with llm_semaphore:
+        return await Runner.run(agent, input_data)
 
-result = Runner.run_sync(agent, "沖縄の名物料理を知ってる？")
-print(result.final_output + "\n")
 
-result = Runner.run_sync(
-    agent, "今夜の夕飯のメニューを考えて。豚肉と野菜があります。"
-)
-print(result.final_output + "\n")
+async def main():
+    _init_mlflow()
+
+    # 各質問は互いに独立しているので、同時に問い合わせる
+    # 一つの質問が失敗しても、他の質問の回答は捨てずに表示する
+    results = await asyncio.gather(
+        *[run_limited(agent, q) for q in QUESTIONS], return_exceptions=True
+    )
+
+    # 結果は質問の順に表示
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"{result}\n")
+            continue
+
+        print(result.final_output + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
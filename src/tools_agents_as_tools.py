@@ -1,4 +1,5 @@
 import asyncio
+import os
 from pprint import pprint
 
 from agents import Agent, Runner
@@ -39,7 +40,9 @@ async def main():
         input="'こんにちは、あるいはこんばんは' をスペイン語とフランス語と英語で言うと？",
     )
     print(result.final_output)
-    pprint(orchestrator_agent)
+    # エージェントの定義は DEBUG_AGENTS が設定されているときだけ表示する
+    if os.getenv("DEBUG_AGENTS"):
+        pprint(orchestrator_agent)
 
 
 if __name__ == "__main__":
@@ -14,16 +14,24 @@ class FunctionArgs(BaseModel):
     age: int
 
 
+# スキーマとバリデータはインポート時に一度だけ用意して使い回す
+FUNCTION_ARGS_SCHEMA = FunctionArgs.model_json_schema()
+FUNCTION_ARGS_VALIDATOR = FunctionArgs.__pydantic_validator__
+
+
 async def run_function(ctx: RunContextWrapper[Any], args: str) -> str:
-    parsed = FunctionArgs.model_validate_json(args)
+    parsed = FUNCTION_ARGS_VALIDATOR.validate_json(args)
     return do_some_work(data=f"{parsed.username} は {parsed.age} 歳です。")
 
 
 tool = FunctionTool(
     name="処理する担当者",
     description="抽出されたユーザーを処理します",
-    params_json_schema=FunctionArgs.model_json_schema(),
+    params_json_schema=FUNCTION_ARGS_SCHEMA,
     on_invoke_tool=run_function,
 )
 
-pprint(tool)
+
+if __name__ == "__main__":
+    # tool の定義を表示する (import しただけでは整形しない)
+    pprint(tool)
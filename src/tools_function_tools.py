@@ -45,11 +45,20 @@ agent = Agent(
     tools=[fetch_weather, read_file],
 )
 
-for tool in agent.tools:
-    if isinstance(tool, FunctionTool):
-        print(f"## tool name: {tool.name}")
-        pprint(tool)
-        print(
-            json.dumps(tool.params_json_schema, indent=2, ensure_ascii=False)
-        )
-        print()
+
+def main():
+    # tool の定義とスキーマを表示する (import しただけでは整形しない)
+    for tool in agent.tools:
+        if isinstance(tool, FunctionTool):
+            print(f"## tool name: {tool.name}")
+            pprint(tool)
+            print(
+                json.dumps(
+                    tool.params_json_schema, indent=2, ensure_ascii=False
+                )
+            )
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 import asyncio
+import enum
 import functools
-from dataclasses import dataclass, field
-from typing import Any, Dict, Literal, Optional
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional
 
 import gradio as gr
 from agents import (
@@ -14,18 +18,40 @@ from agents import (
 
 HUMAN_INPUT_TIMEOUT = 300
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+
+class Status(enum.IntEnum):
+    """人間とシステムの対話の状態"""
+
+    IDLE = 0
+    WAITING_FOR_HUMAN = 1
+    HUMAN_RESPONDED = 2
+
+
+@dataclass(frozen=True, slots=True)
 class HumanInteractContext:
     """
     人間とシステムが交流するためのコンテキストオブジェクト
     System -> human -> System のメッセージのやり取りと状態を保持
+
+    変更せずに丸ごと差し替えるので、別スレッドの UI からも
+    途中まで更新された状態が見えることはない
     """
 
     system_to_human_message: Optional[str] = None
     human_to_system_message: Optional[str] = None
-    status: Literal["idle", "waiting_for_human", "human_responded"] = "idle"
-    event: asyncio.Event = field(default_factory=asyncio.Event)
+    status: Status = Status.IDLE
+
+
+# context の更新を待つリスナー (待機するイベントループと Event の組)
+UpdateListener = tuple[asyncio.AbstractEventLoop, asyncio.Event]
+
+
+def _set_result_if_pending(future: asyncio.Future, result: str) -> None:
+    """タイムアウト等で既に完了した Future には結果を設定しない"""
+    if not future.done():
+        future.set_result(result)
 
 
 class HumanInteractManager:
@@ -33,35 +59,89 @@ class HumanInteractManager:
     人間とシステムが交流するための方法と対話の状態を管理。
     """
 
+    __slots__ = ("context", "_loop", "_pending", "_listeners")
+
     def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
         self.context: HumanInteractContext = HumanInteractContext()
         self._loop: asyncio.AbstractEventLoop = loop
-
-    def send_system_to_human(self, message: str) -> None:
-        """システムから人間へメッセージを送る"""
-        self.context.system_to_human_message = message
-        self.context.status = "waiting_for_human"
+        # 質問ごとに作る、人間の応答を受け取る Future
+        self._pending: Optional[asyncio.Future[str]] = None
+        # context の更新を待っているリスナー (イベントループと Event の組)
+        self._listeners: set[UpdateListener] = set()
+
+    def add_listener(self) -> UpdateListener:
+        """context の更新を通知するリスナーを登録する
+
+        Event は呼び出し元のイベントループで待つので、そのループと組で登録する
+        """
+        listener = (asyncio.get_running_loop(), asyncio.Event())
+        self._listeners.add(listener)
+        return listener
+
+    def remove_listener(self, listener: UpdateListener) -> None:
+        """リスナーの登録を解除する"""
+        self._listeners.discard(listener)
+
+    def _notify_update(self) -> None:
+        """context の更新をリスナーへ通知する
+
+        リスナーは別スレッドのイベントループにいる場合があるので
+        スレッドセーフに Event をセットする
+        """
+        for loop, event in list(self._listeners):
+            loop.call_soon_threadsafe(event.set)
+
+    def send_system_to_human(self, message: str) -> asyncio.Future[str]:
+        """システムから人間へメッセージを送る
+
+        人間の応答を受け取る Future を返す
+        """
+        pending = self._loop.create_future()
+        self._pending = pending
+        self.context = replace(
+            self.context,
+            system_to_human_message=message,
+            status=Status.WAITING_FOR_HUMAN,
+        )
+        self._notify_update()
+        return pending
 
     def receive_system_to_human(self) -> str:
         """システムから人間へのメッセージを受けとる"""
         return self.context.system_to_human_message
 
-    def send_human_to_system(self, message: str) -> None:
-        """人間からシステムへメッセージを送る"""
-        self.context.human_to_system_message = message
-        self.context.status = "human_responded"
-        if self._loop and self._loop.is_running():
-            self._loop.call_soon_threadsafe(self.context.event.set)
-
-    def receive_human_to_system(self) -> str:
-        """人間からシステムへのメッセージを受けとる"""
-        message = self.context.human_to_system_message
-        self.set_status_idle()
-        return message
+    async def send_human_to_system(self, message: str) -> None:
+        """人間からシステムへメッセージを送る
+
+        エージェントのイベントループ上で実行すること
+        (別スレッドからは asyncio.run_coroutine_threadsafe で呼ぶ)
+        """
+        if self.context.status is not Status.WAITING_FOR_HUMAN:
+            # 回答を待っていない (タイムアウト済み等) なら受け付けない
+            logger.debug(
+                "応答を破棄しました (status=%s): %s",
+                self.context.status.name,
+                message,
+            )
+            return
+        logger.debug("人間の応答を受け付けました: %s", message)
+        self.context = replace(
+            self.context,
+            human_to_system_message=message,
+            status=Status.HUMAN_RESPONDED,
+        )
+        if self._pending is not None:
+            _set_result_if_pending(self._pending, message)
+        self._notify_update()
 
     def set_status_idle(self) -> None:
         """会話のステイタスを idle に変更する"""
-        self.context.status = "idle"
+        if self.context.status is Status.IDLE and self._pending is None:
+            # 既に idle なら UI へ余計な更新を通知しない
+            return
+        self.context = replace(self.context, status=Status.IDLE)
+        self._pending = None
+        self._notify_update()
 
 
 class HumanToSystemTimeoutException(Exception):
@@ -79,21 +159,23 @@ async def ask_to_human(run_ctx: RunContextWrapper[Any], question: str) -> str:
         question: システムから人間への質問の文字列
     """
     interact_manager: HumanInteractManager = run_ctx.context
-    interact_manager.context.event.clear()
-    interact_manager.send_system_to_human(f"あなたに質問です。\n{question}")
+    logger.debug("人間へ質問します: %s", question)
+    pending = interact_manager.send_system_to_human(
+        f"あなたに質問です。\n{question}"
+    )
     try:
-        await asyncio.wait_for(
-            interact_manager.context.event.wait(), timeout=HUMAN_INPUT_TIMEOUT
+        # wait_for と違い、待機を別 Task で包まずにタイムアウトさせる
+        # タイムアウトすると Future は取り消され、後から届いた応答は捨てられる
+        async with asyncio.timeout(HUMAN_INPUT_TIMEOUT):
+            response = await pending
+    except TimeoutError:
+        logger.warning(
+            "人間の応答がありませんでした: Timeout %s 秒", HUMAN_INPUT_TIMEOUT
         )
-        response = interact_manager.receive_human_to_system()
-    except asyncio.TimeoutError:
-        print(
-            "人間の応答がありませんでした: Timeout "
-            f"{HUMAN_INPUT_TIMEOUT} 秒"
-        )
-        interact_manager.set_status_idle()
         # funcion_tool は例外を吸収するようので適当な例外を飛ばす
         raise HumanToSystemTimeoutException("人間の応答がありませんでした")
+    finally:
+        interact_manager.set_status_idle()
     return response
 
 
@@ -107,62 +189,97 @@ class GradioUserInterface:
         # Human Input のコンテキストを定義
         self.interact_manager = HumanInteractManager(self.loop)
 
+        # ブラウザで UI が開かれたらセットされる
+        self.ready = asyncio.Event()
+
     def _update_ui_components(self, ctx: HumanInteractContext):
-        """現在のコンテキストに基づいて UI コンポーネントを返す"""
-        is_waiting = ctx.status == "waiting_for_human"
-
-        # 入力用 Textbox の設定
-        input_textbox_kwargs = {
-            "interactive": is_waiting,
-            "placeholder": "回答を入力してください" if is_waiting else "",
-        }
-        if not is_waiting:
-            input_textbox_kwargs["value"] = ctx.human_to_system_message
-
-        # UI コンポーネントを作成して返す
+        """現在のコンテキストに基づいて UI コンポーネントの更新内容を返す
+
+        コンポーネントを作り直さず、変更するプロパティだけを gr.update で渡す
+        """
+        is_waiting = ctx.status is Status.WAITING_FOR_HUMAN
+
         return (
-            gr.Textbox(value=ctx.system_to_human_message, interactive=False),
-            gr.Textbox(**input_textbox_kwargs),
-            gr.Button(interactive=is_waiting),
-            gr.Textbox(value=ctx.status, interactive=False),
+            gr.update(value=ctx.system_to_human_message),
+            # 入力欄の値は submit_message だけが書き換えるので、ここでは触らない
+            gr.update(
+                interactive=is_waiting,
+                placeholder="回答を入力してください" if is_waiting else "",
+            ),
+            gr.update(interactive=is_waiting),
+            gr.update(value=ctx.status.name.lower()),
         )
 
-    def set_components(self) -> gr.Blocks:
-        """Gradio UI の定義とコールバックの設定"""
-
-        async def check_interact_update():
-            """context の更新を確認"""
-            return self._update_ui_components(self.interact_manager.context)
+    @functools.cached_property
+    def demo(self) -> gr.Blocks:
+        """Gradio UI の定義とコールバックの設定
+
+        UI の構築は最初にアクセスしたときの一度だけ行う
+        """
+
+        async def stream_interact_updates():
+            """context が更新されるたびに UI コンポーネントを返す"""
+            listener = self.interact_manager.add_listener()
+            _, updated = listener
+            # UI が開かれたことをエージェント側のイベントループへ知らせる
+            self.loop.call_soon_threadsafe(self.ready.set)
+            last_ctx = None
+            try:
+                while True:
+                    # context は一度読めば途中で書き換わらない
+                    ctx = self.interact_manager.context
+                    # 表示内容が変わっていなければ何も送らない
+                    if ctx != last_ctx:
+                        last_ctx = ctx
+                        yield self._update_ui_components(ctx)
+                    # 更新の通知があるまで待つ (ポーリングはしない)
+                    await updated.wait()
+                    updated.clear()
+            finally:
+                # ブラウザが閉じられたらリスナーを解除する
+                self.interact_manager.remove_listener(listener)
 
         async def submit_message(human_to_system_message: str):
             """Human Input を System へ送信"""
 
-            if (
-                self.interact_manager.context.status == "waiting_for_human"
-                and str(human_to_system_message) != ""
-            ):
+            if str(human_to_system_message) != "":
                 # 人間の入力内容を tool へ送信
-                self.interact_manager.send_human_to_system(
-                    human_to_system_message
+                # Gradio は別スレッドのイベントループで動いているので、
+                # 状態の更新はエージェントのイベントループで行う
+                future = asyncio.run_coroutine_threadsafe(
+                    self.interact_manager.send_human_to_system(
+                        human_to_system_message
+                    ),
+                    self.loop,
                 )
+                await asyncio.wrap_future(future)
 
-            return self._update_ui_components(self.interact_manager.context)
+            # 入力欄の値を消すのはここだけで、
+            # それ以外の表示は demo.load のストリームに任せる
+            # (ここで読んだ context は既に古い可能性があるので返さない)
+            return gr.skip(), gr.update(value=""), gr.skip(), gr.skip()
 
         # Gradio の UI を定義
         with gr.Blocks() as demo:
-            output_text = gr.Textbox(label="システム -> 人間")
+            output_text = gr.Textbox(
+                label="システム -> 人間", interactive=False
+            )
             input_text = gr.Textbox(label="人間 -> システム")
             submit_button = gr.Button("送信")
-            status_text = gr.Textbox(label="コンテキストのステイタス")
+            status_text = gr.Textbox(
+                label="コンテキストのステイタス", interactive=False
+            )
 
             outputs = [output_text, input_text, submit_button, status_text]
 
-            # gr.State() で監視したいところだが、event のポインタが
-            # 渡らないため、やむを得ずポーリングしている
-            gr.Timer(value=0.5).tick(
-                fn=check_interact_update,
+            # context の更新をページの読み込みから通知ベースで UI に流し込む
+            # セッションごとに終わらないイベントになるので同時実行数は無制限にする
+            demo.load(
+                fn=stream_interact_updates,
                 inputs=[],
                 outputs=outputs,
+                concurrency_limit=None,
+                show_progress="hidden",
             )
 
             # 送信ボタン押下時に発火
@@ -175,29 +292,44 @@ class GradioUserInterface:
         return demo
 
     def run_background(
-        self, launch_config: Dict[str, Any] = {"share": False}
+        self, launch_config: Optional[Dict[str, Any]] = None
     ) -> None:
         """Gradio バックエンドをバックグラウンドで起動"""
+        if launch_config is None:
+            launch_config = {"share": False}
 
         # Gradio コンポーネントを配置
         # demo にグローバルでアクセスできないので自動リロードが無効
-        demo = self.set_components()
+        demo = self.demo
 
         # Gradio をバックグラウンドで起動
+        # サーバーは終了しないので、既定のスレッドプールのスレッドを
+        # 占有しないように専用のスレッドで動かす
+        self._launch_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="gradio-launch"
+        )
         self.loop.run_in_executor(
-            None, functools.partial(demo.launch, launch_config)
+            self._launch_executor,
+            functools.partial(demo.launch, **launch_config),
         )
 
 
 async def main():
+    # このモジュールのログだけを環境変数 LOG_LEVEL のレベルで出力する
+    # (ルートロガーは設定しないので httpx や gradio のログは増えない)
+    logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    logger.addHandler(logging.StreamHandler())
+
     # Gradio Components を配置
     gradio_user_interface = GradioUserInterface()
 
     # Gradio をバックグラウンドで実行
     gradio_user_interface.run_background()
 
-    # Gradio の起動待ちで軽くスリープ(簡易的な実装)
-    await asyncio.sleep(3)
+    # ブラウザで UI が開かれるまで待つ
+    # (誰も見ていないうちに質問してタイムアウトしないように)
+    print("ブラウザで Gradio の UI を開いてください")
+    await gradio_user_interface.ready.wait()
 
     # エージェントを定義
     human_agent = Agent(
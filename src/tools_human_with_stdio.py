@@ -10,7 +10,9 @@ async def ask_to_human(question: str) -> str:
     Args:
         question: システムから人間への質問の文字列
     """
-    return input(question)
+    # 入力待ちでイベントループを止めないよう別スレッドで読む
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, input, question)
 
 
 async def main():
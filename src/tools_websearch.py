@@ -1,3 +1,4 @@
+import asyncio
 from pprint import pprint
 
 from agents import Agent, Runner, WebSearchTool
@@ -7,10 +8,16 @@ qiita_search = Agent(
     tools=[WebSearchTool(search_context_size="high")],
 )
 
-result = Runner.run_sync(
-    qiita_search,
-    "Qiita で OpenAI Agents SDK について書いている記事を5件教えて",
-)
 
-print(result.final_output)
-pprint(qiita_search)
+async def main():
+    result = await Runner.run(
+        qiita_search,
+        "Qiita で OpenAI Agents SDK について書いている記事を5件教えて",
+    )
+
+    print(result.final_output)
+    pprint(qiita_search)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
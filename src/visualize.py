@@ -1,8 +1,10 @@
+import asyncio
 import io
 
 import gradio as gr
 from agents import Agent, Runner, function_tool
 from agents.extensions.visualization import draw_graph, get_main_graph
+from openai.types.responses import ResponseTextDeltaEvent
 from PIL import Image
 from pydantic import BaseModel
 
@@ -52,14 +54,15 @@ diagram_agent = Agent(
 )
 
 
-async def on_load():
-    """
-    Gradio がロードされた後に呼ばれる関数
+async def convert_to_mermaid():
+    """Graphviz のダイアグラムを Mermaid に変換
+
+    変換中の出力を逐次返し、最後に変換結果を返す
     """
 
     # convert
-    diagram_string = get_main_graph(triage_agent)
-    mermaid = await Runner.run(
+    diagram_string = get_agent_dot(triage_agent)
+    result = Runner.run_streamed(
         diagram_agent,
         input=f"""
         Mermaid に変換して。色は無視して。
@@ -70,6 +73,16 @@ async def on_load():
     """,
     )
 
+    # 受信途中の出力 (構造化出力の JSON) をそのまま表示する
+    streamed = ""
+    async for event in result.stream_events():
+        if event.type == "raw_response_event" and isinstance(
+            event.data, ResponseTextDeltaEvent
+        ):
+            streamed += event.data.delta
+            yield gr.Markdown(f"```\n{streamed}\n```"), gr.skip()
+
+    mermaid = result.final_output
     text = f"""
     ダイアグラムのコードを変換しました。
 
@@ -81,39 +94,91 @@ async def on_load():
 
     ### 変換後(Mermaid)
 
-    {mermaid.final_output.body}
+    {mermaid.body}
 
     ### 変換コメント
 
-    {mermaid.final_output.comment}
+    {mermaid.comment}
     """
 
-    return (
-        gr.Markdown(mermaid.final_output.body),
+    yield (
+        gr.Markdown(mermaid.body),
         gr.Textbox(text, lines=40),
     )
 
 
-def get_pil_image_from_agent(agent):
+# エージェントごとの Graphviz dot のコードと描画済みの PIL イメージ
+# エージェントはモジュールで定義したまま破棄されないので id をキーにする
+_agent_dots: dict[int, str] = {}
+_agent_images: dict[int, Image.Image] = {}
+
+
+def get_agent_dot(agent) -> str:
+    """エージェントの Graphviz dot のコードを取得
+
+    エージェントの構成は変わらないので、一度作ったコードを使い回す
+    """
+    dot = _agent_dots.get(id(agent))
+    if dot is None:
+        dot = get_main_graph(agent)
+        _agent_dots[id(agent)] = dot
+    return dot
+
+
+def render_agent_image(agent) -> Image.Image:
     """OpenAI Agents SDK のビジュアライズ機能を利用
     Graphviz で PIL イメージを作成"""
     graph = draw_graph(agent)
-    image_stream = io.BytesIO(graph.pipe(format="png"))
-    return Image.open(image_stream)
+    image = Image.open(io.BytesIO(graph.pipe(format="png")))
+    # セッション間で共有するので、ここで画像を読み込んでおく
+    image.load()
+    return image
+
+
+async def get_pil_image_from_agent(agent) -> Image.Image:
+    """エージェントのダイアグラムの PIL イメージを取得
+
+    dot コマンドの実行でイベントループを止めないよう別スレッドで描画し、
+    結果はキャッシュして次のセッションからは使い回す
+    """
+    image = _agent_images.get(id(agent))
+    if image is None:
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(None, render_agent_image, agent)
+        _agent_images[id(agent)] = image
+    return image
+
+
+async def on_load():
+    """
+    Gradio がロードされた後に呼ばれる関数
+    """
+    # ダイアグラムの描画と LLM での変換を並行して行い、
+    # 変換の途中経過はストリーミングで表示する
+    image_task = asyncio.create_task(get_pil_image_from_agent(triage_agent))
+    image_shown = False
+    try:
+        async for markdown, text in convert_to_mermaid():
+            image = gr.skip()
+            if not image_shown and image_task.done():
+                image, image_shown = image_task.result(), True
+            yield image, markdown, text
+        if not image_shown:
+            yield await image_task, gr.skip(), gr.skip()
+    finally:
+        image_task.cancel()
 
 
 with gr.Blocks() as demo:
     with gr.Row():
-        image = gr.Image(
-            get_pil_image_from_agent(triage_agent),
-            label="オリジナル(Graphviz)",
-        )
+        # 画像はページの読み込み後に on_load で描画する
+        image = gr.Image(label="オリジナル(Graphviz)")
         with gr.Column():
             with gr.Group():
                 markdown = gr.Markdown(label="mermaid")
             with gr.Accordion(open=False):
                 text = gr.Textbox(lines=40)
-    demo.load(fn=on_load, inputs=[], outputs=[markdown, text])
+    demo.load(fn=on_load, inputs=[], outputs=[image, markdown, text])
 
 if __name__ == "__main__":
     demo.launch(share=False, debug=True)
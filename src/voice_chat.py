@@ -8,6 +8,9 @@ async def reverse_numpy_array_async(data: np.ndarray) -> np.ndarray:
     """
     NumPy 配列を非同期的に逆順にする関数 (デモンストレーション用)。
     実際の処理は同期的だが、async/await の使い方を示す。
+    待ち時間は設けず、asyncio.sleep(0) でイベントループに制御を返すだけにする。
+    逆順のビューを連続したメモリにコピーして返すので、
+    後段の WAV エンコードでストライドのある配列を扱わずに済む。
 
     Args:
         data (np.ndarray): 逆順にする NumPy 配列。
@@ -15,8 +18,9 @@ async def reverse_numpy_array_async(data: np.ndarray) -> np.ndarray:
     Returns:
         np.ndarray: 逆順になった NumPy 配列。
     """
-    await asyncio.sleep(0.1)  # 例: I/O待ちなど非同期処理をシミュレート
-    reversed_data = data[::-1]
+    # 多チャンネルの場合も時間軸 (axis 0) だけを逆順にする
+    reversed_data = np.ascontiguousarray(data[::-1])
+    await asyncio.sleep(0)
     return reversed_data
 
 